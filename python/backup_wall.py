@@ -1,34 +1,113 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import matplotlib as mpl
 import matplotlib.pyplot as plt
+import scipy.fft
 from scipy.ndimage import gaussian_filter1d
+from scipy.signal import fftconvolve, sosfiltfilt, tf2sos
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 
 # ============================================
 # LOAD CSI FILE
 # ============================================
-def load_csi(filename):
+def load_csi(filename, dtype=np.float32):
+
+    # Reuse the parsed array from the sidecar .npy when it is newer
+    # than the text capture. The version suffix retires caches written
+    # in the old time-major (T, K) orientation, which would otherwise
+    # load silently transposed
+
+    cache = filename + ".v2.npy"
+
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(filename):
+
+        cached = np.load(cache, mmap_mode="r")
+
+        if cached.dtype == dtype:
+            return cached
 
-    data = []
+    # Two-pass streaming parse over raw bytes: count matching lines
+    # first, then fill a preallocated array — no Python list-of-rows
 
-    with open(filename, "r") as f:
+    with open(filename, "rb") as f:
+
+        n_rows = 0
+        max_cols = 0
 
         for line in f:
 
-            if "CSI_DATA:" in line:
+            if b"CSI_DATA:" in line:
+                n_rows += 1
+                cols = line.count(b" ") + 1
+                if cols > max_cols:
+                    max_cols = cols
+
+        arr = np.empty((n_rows, max_cols), dtype=np.int16)
+        lens = np.zeros(n_rows, dtype=np.int32)
+
+        f.seek(0)
+        i = 0
+
+        for line in f:
+
+            marker = line.find(b"CSI_DATA:")
+
+            if marker < 0:
+                continue
+
+            try:
+                row = np.fromstring(line[marker + 9:], sep=" ", dtype=np.int16)
+            except ValueError:
+                row = None
+
+            if row is not None and row.size:
+                lens[i] = row.size
+                arr[i, :row.size] = row
+
+            i += 1
+
+    # Drop unparsable rows and trim the rest to equal length;
+    # float32 halves the bandwidth of every downstream reduction
+
+    valid = lens > 0
+    min_len = int(lens[valid].min())
+
+    # Subcarrier-major (K, T) layout: heatmaps render this orientation
+    # directly and per-subcarrier reductions walk contiguous rows
+
+    arr = arr[valid][:, :min_len].astype(dtype).T.copy()
+
+    np.save(cache, arr)
+
+    return arr
+
+
+# ============================================
+# MEAN |CSI| ENERGY (REUSABLE BUFFER)
+# ============================================
+_energy_buf = None
+
+def mean_abs_energy(data):
 
-                parts = line.replace("CSI_DATA:", "").strip().split()
+    # np.abs writes into one reusable buffer instead of allocating a
+    # fresh T x K temporary per dataset
 
-                try:
-                    values = [int(x) for x in parts]
-                    data.append(values)
-                except:
-                    pass
+    global _energy_buf
 
-    min_len = min(len(row) for row in data)
+    if _energy_buf is None or _energy_buf.shape != data.shape:
+        _energy_buf = np.empty(data.shape, dtype=np.float32)
 
-    data = [row[:min_len] for row in data]
+    np.abs(data, out=_energy_buf)
 
-    return np.array(data)
+    return _energy_buf.mean(axis=-2, dtype=np.float64)
 
 
 # ============================================
@@ -46,228 +125,401 @@ def normalize_for_display(data):
 
 
 # ============================================
-# PREPROCESS FOR MOTION TRACKING
+# DOWNSAMPLE FOR DISPLAY
 # ============================================
-def preprocess_csi(data):
 
-    data = data - np.mean(data, axis=0)
+# A screen rarely resolves more than ~2000 pixels of time axis; stride
+# long captures before handing the full array to the renderer
+_MAX_DISPLAY_FRAMES = 2000
 
-    data = np.abs(data)
+def downsample_for_display(data):
 
-    data = gaussian_filter1d(data, sigma=2, axis=0)
+    step = data.shape[-1] // _MAX_DISPLAY_FRAMES
+
+    if step > 1:
+        return data[..., ::step]
 
     return data
 
 
 # ============================================
-# COMPUTE MOTION PATH
+# RECURSIVE GAUSSIAN SMOOTHER (YOUNG-VAN VLIET)
 # ============================================
-def compute_motion_path(data):
+def _gaussian_sos(sigma):
+
+    # 3rd-order recursive Gaussian; forward+backward sosfiltfilt
+    # approximates the symmetric filter in O(T) regardless of sigma
+
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * np.sqrt(1.0 - 0.26891 * sigma)
+
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    b1 = 2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3
+    b2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3)
+    b3 = 0.422205 * q ** 3
+
+    gain = 1.0 - (b1 + b2 + b3) / b0
+
+    return tf2sos([gain], [1.0, -b1 / b0, -b2 / b0, -b3 / b0])
+
+
+# float32 coefficients keep sosfiltfilt from upcasting the data
+_GAUSS_SOS = _gaussian_sos(2.0).astype(np.float32)
+
+
+def _gauss_kernel(sigma, truncate=4.0):
+
+    radius = int(truncate * sigma + 0.5)
 
-    processed = preprocess_csi(data)
+    x = np.arange(-radius, radius + 1)
 
-    path = []
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
 
-    for t in range(processed.shape[0]):
+    return (kernel / kernel.sum()).astype(np.float32)
 
-        signal = processed[t]
 
-        total_energy = np.sum(signal)
+_GAUSS_KERNEL = _gauss_kernel(2.0)
 
-        if total_energy == 0:
-            centroid = 0
-        else:
-            indices = np.arange(len(signal))
-            centroid = np.sum(indices * signal) / total_energy
+# Below this many frames the recursive filter wins; above it, one
+# multi-threaded FFT convolution shared by all subcarriers is faster
+_FFT_MIN_FRAMES = 4096
 
-        path.append(centroid)
 
-    path = np.array(path)
+def _smooth_time(data, axis=0):
 
-    path = gaussian_filter1d(path, sigma=2)
+    if data.shape[axis] >= _FFT_MIN_FRAMES:
 
-    return path
+        shape = [1] * data.ndim
+        shape[axis] = _GAUSS_KERNEL.size
+
+        with scipy.fft.set_workers(-1):
+            return fftconvolve(data, _GAUSS_KERNEL.reshape(shape), mode="same", axes=axis)
+
+    return sosfiltfilt(_GAUSS_SOS, data, axis=axis)
 
 
 # ============================================
-# LOAD DATASETS
+# PREPROCESS FOR MOTION TRACKING
 # ============================================
+def preprocess_csi(data):
+
+    # Static removal and magnitude share one float32 buffer — a single
+    # K x T temporary instead of one per stage
+
+    means = np.mean(data, axis=1, keepdims=True)
+
+    buf = np.empty(data.shape, dtype=np.float32)
 
-print("Loading CSI datasets...")
+    np.subtract(data, means, out=buf)
+    np.abs(buf, out=buf)
 
-empty = load_csi("../data/empty.txt")
-occupied = load_csi("../data/occupied.txt")
-walking = load_csi("../data/walking.txt")
-wall = load_csi("../data/wall.txt")
+    return _smooth_time(buf, axis=1)
 
-datasets = [
-    ("Empty Room", empty),
-    ("Occupied (Still)", occupied),
-    ("Walking", walking),
-    ("Behind Wall", wall)
-]
 
 # ============================================
-# ENERGY COMPARISON GRAPH
+# SUBCARRIER INDEX CACHE
 # ============================================
-empty_energy = np.mean(np.abs(empty), axis=1)
-occupied_energy = np.mean(np.abs(occupied), axis=1)
-walking_energy = np.mean(np.abs(walking), axis=1)
-wall_energy = np.mean(np.abs(wall), axis=1)
-
-plt.figure(figsize=(12,6))
-plt.plot(empty_energy, label="Empty Room")
-plt.plot(occupied_energy, label="Occupied (Still)")
-plt.plot(walking_energy, label="Walking")
-plt.plot(wall_energy, label="Behind Wall")
-plt.title("CSI Energy Comparison")
-plt.xlabel("Time Frame")
-plt.ylabel("CSI Energy")
-plt.legend()
-plt.grid()
-plt.show()
+
+_idx_cache = {}
+
+def _subcarrier_idx(n, dtype):
+
+    # The centroid weights only depend on (K, dtype) — build them once
+
+    key = (n, np.dtype(dtype))
+
+    idx = _idx_cache.get(key)
+
+    if idx is None:
+        idx = np.arange(n, dtype=dtype)
+        _idx_cache[key] = idx
+
+    return idx
 
 
 # ============================================
-# ENERGY GRAPHS — SEPARATE PLOTS
+# FUSED MOTION KERNEL (NUMBA)
 # ============================================
+if NUMBA_AVAILABLE:
 
-energy_sets = [
-    ("Empty Room", np.mean(np.abs(empty), axis=1)),
-    ("Occupied (Still)", np.mean(np.abs(occupied), axis=1)),
-    ("Walking", np.mean(np.abs(walking), axis=1)),
-    ("Behind Wall", np.mean(np.abs(wall), axis=1))
-]
+    @njit(parallel=True, fastmath=True)
+    def _motion_kernel(data, means, out_total, out_weighted):
 
-fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+        # Static removal, magnitude and centroid reductions in one
+        # pass over a (K, T) array
 
-for ax, (name, energy) in zip(axes.flat, energy_sets):
-    ax.plot(energy)
-    ax.set_title(f"{name} — CSI Energy")
-    ax.set_xlabel("Time Frame")
-    ax.set_ylabel("CSI Energy")
-    ax.grid(True)
+        for t in prange(data.shape[1]):
 
-plt.suptitle("CSI Energy — Individual Dataset Analysis", fontsize=15)
-plt.tight_layout()
-plt.show()
+            total = 0.0
+            weighted = 0.0
 
+            for k in range(data.shape[0]):
+                v = abs(data[k, t] - means[k])
+                total += v
+                weighted += k * v
 
+            out_total[t] = total
+            out_weighted[t] = weighted
 
 
 # ============================================
-# HEATMAPS WITH PROPER ALIGNMENT
+# COMPUTE MOTION PATHS (BATCHED)
 # ============================================
+def compute_motion_paths(stack):
 
-empty_n = normalize_for_display(empty)
-occupied_n = normalize_for_display(occupied)
-walking_n = normalize_for_display(walking)
-wall_n = normalize_for_display(wall)
+    # One batched reduction over the (N, K, T) stack instead of one
+    # dispatch per dataset
 
-global_min = min(empty_n.min(), occupied_n.min(), walking_n.min(), wall_n.min())
-global_max = max(empty_n.max(), occupied_n.max(), walking_n.max(), wall_n.max())
+    n_frames = stack.shape[2]
 
-fig = plt.figure(figsize=(14,10))
+    if NUMBA_AVAILABLE:
 
-gs = fig.add_gridspec(2, 3, width_ratios=[1,1,0.05])
+        means = stack.mean(axis=2)
 
-axes = [
-    fig.add_subplot(gs[0,0]),
-    fig.add_subplot(gs[0,1]),
-    fig.add_subplot(gs[1,0]),
-    fig.add_subplot(gs[1,1])
-]
+        total = np.zeros((stack.shape[0], n_frames), dtype=np.float32)
+        weighted = np.zeros((stack.shape[0], n_frames), dtype=np.float32)
 
-cbar_ax = fig.add_subplot(gs[:,2])
+        for i in range(stack.shape[0]):
+            _motion_kernel(stack[i], means[i], total[i], weighted[i])
 
-normalized_sets = [
-    ("Empty Room", empty_n),
-    ("Occupied (Still)", occupied_n),
-    ("Walking", walking_n),
-    ("Behind Wall", wall_n)
-]
+        # Time smoothing commutes with the linear subcarrier
+        # reductions, so smoothing the two accumulators matches the
+        # fallback's full 2D smoothing at 1/K of the cost
 
-for ax, (name, data) in zip(axes, normalized_sets):
+        total = _smooth_time(total, axis=1)
+        weighted = _smooth_time(weighted, axis=1)
 
-    im = ax.imshow(
-        data.T,
-        aspect='auto',
-        origin='lower',
-        cmap='RdBu_r',
-        vmin=global_min,
-        vmax=global_max
-    )
+        paths = weighted / np.maximum(total, 1e-12)
 
-    ax.set_title(name)
-    ax.set_xlabel("Time Frame")
-    ax.set_ylabel("Subcarrier Index")
+    else:
 
-fig.colorbar(im, cax=cbar_ax)
-cbar_ax.set_ylabel("Normalized CSI Amplitude")
+        processed = np.abs(stack - stack.mean(axis=2, keepdims=True))
+        processed = _smooth_time(processed, axis=2)
 
-plt.suptitle("CSI Heatmaps")
+        idx = _subcarrier_idx(stack.shape[1], processed.dtype)
 
-plt.show()
+        weighted = idx @ processed
+        total = processed.sum(axis=1)
 
+        # Branchless masked division: zero frames stay zero without
+        # evaluating the division for them
+        paths = np.zeros_like(total)
+        np.divide(weighted, total, out=paths, where=total > 0)
 
-# ============================================
-# MOTION TRACKING FOR ALL DATASETS
-# ============================================
+    # truncate=3.0 trims the kernel radius by 25%; float32 output
+    # avoids a float64 upcast
+    paths = gaussian_filter1d(paths, sigma=2, axis=-1, truncate=3.0, output=np.float32)
 
-motion_paths = []
+    return paths
 
-for name, data in datasets:
 
-    path = compute_motion_path(data)
+def compute_motion_path(data):
 
-    motion_paths.append((name, path))
+    return compute_motion_paths(data[np.newaxis])[0]
 
 
 # ============================================
-# HEATMAP + MOTION PATH OVERLAY
+# MAIN
 # ============================================
+def main():
 
-fig, axes = plt.subplots(2,2, figsize=(14,10))
+    # ============================================
+    # LOAD DATASETS
+    # ============================================
 
-for ax, (name, data), (_, path) in zip(axes.flat, datasets, motion_paths):
+    print("Loading CSI datasets...")
 
-    display = normalize_for_display(data)
+    # Each capture parses independently — one worker per dataset
 
-    im = ax.imshow(
-        display.T,
-        aspect='auto',
-        origin='lower',
-        cmap='RdBu_r'
-    )
+    with ProcessPoolExecutor(max_workers=4) as ex:
 
-    ax.plot(path, color='lime', linewidth=2)
+        empty, occupied, walking, wall = ex.map(load_csi, [
+            "../data/empty.txt",
+            "../data/occupied.txt",
+            "../data/walking.txt",
+            "../data/wall.txt",
+        ])
 
-    ax.set_title(name)
-    ax.set_xlabel("Time Frame")
-    ax.set_ylabel("Subcarrier Index")
+    # ============================================
+    # BATCH DATASETS INTO PER-WIDTH (N, K, T) STACKS
+    # ============================================
 
-fig.colorbar(im, ax=axes)
-plt.suptitle("Motion Tracking Comparison")
+    names = ["Empty Room", "Occupied (Still)", "Walking", "Behind Wall"]
+    raw = [empty, occupied, walking, wall]
 
-plt.show()
+    # Only time is common across captures — each keeps its own
+    # subcarrier width, so datasets are grouped by K and every group
+    # batches into one stack
 
+    min_time = min(d.shape[1] for d in raw)
+    trimmed = [d[:, :min_time] for d in raw]
 
-# ============================================
-# MOTION PATH COMPARISON GRAPH
-# ============================================
+    groups = {}
+    for i, d in enumerate(trimmed):
+        groups.setdefault(d.shape[0], []).append(i)
+
+    stacks = [(idxs, np.stack([trimmed[i] for i in idxs]).astype(np.float32))
+              for idxs in groups.values()]
+
+    print("All datasets trimmed to:", min_time, "time frames")
+
+    datasets = list(zip(names, trimmed))
+
+    # ============================================
+    # ENERGY COMPARISON GRAPH
+    # ============================================
+    energies = [None] * len(raw)   # one (T,) curve per dataset
+
+    for idxs, stack in stacks:
+        for i, energy in zip(idxs, mean_abs_energy(stack)):
+            energies[i] = energy
+
+    plt.figure(figsize=(12,6))
+
+    for name, energy in zip(names, energies):
+        plt.plot(energy, label=name)
+
+    plt.title("CSI Energy Comparison")
+    plt.xlabel("Time Frame")
+    plt.ylabel("CSI Energy")
+    plt.legend()
+    plt.grid()
+    plt.show()
+
+
+    # ============================================
+    # ENERGY GRAPHS — SEPARATE PLOTS
+    # ============================================
+
+    energy_sets = list(zip(names, energies))
+
+    fig, axes = plt.subplots(2, 2, figsize=(14, 10))
+
+    for ax, (name, energy) in zip(axes.flat, energy_sets):
+        ax.plot(energy)
+        ax.set_title(f"{name} — CSI Energy")
+        ax.set_xlabel("Time Frame")
+        ax.set_ylabel("CSI Energy")
+        ax.grid(True)
+
+    plt.suptitle("CSI Energy — Individual Dataset Analysis", fontsize=15)
+    plt.tight_layout()
+    plt.show()
+
+
+
+
+    # ============================================
+    # HEATMAPS WITH PROPER ALIGNMENT
+    # ============================================
+
+    normalized_sets = [(name, normalize_for_display(d)) for name, d in datasets]
+
+    global_min = min(d.min() for _, d in normalized_sets)
+    global_max = max(d.max() for _, d in normalized_sets)
+
+    # One shared norm for every heatmap instead of per-axes vmin/vmax
+    heatmap_norm = mpl.colors.Normalize(vmin=global_min, vmax=global_max)
+
+    fig = plt.figure(figsize=(14,10))
+
+    gs = fig.add_gridspec(2, 3, width_ratios=[1,1,0.05])
+
+    axes = [
+        fig.add_subplot(gs[0,0]),
+        fig.add_subplot(gs[0,1]),
+        fig.add_subplot(gs[1,0]),
+        fig.add_subplot(gs[1,1])
+    ]
+
+    cbar_ax = fig.add_subplot(gs[:,2])
+
+    for ax, (name, data) in zip(axes, normalized_sets):
+
+        im = ax.imshow(
+            downsample_for_display(data),
+            aspect='auto',
+            origin='lower',
+            cmap='RdBu_r',
+            norm=heatmap_norm,
+            extent=(0, data.shape[1], 0, data.shape[0])
+        )
+
+        ax.set_title(name)
+        ax.set_xlabel("Time Frame")
+        ax.set_ylabel("Subcarrier Index")
+
+    fig.colorbar(im, cax=cbar_ax)
+    cbar_ax.set_ylabel("Normalized CSI Amplitude")
+
+    plt.suptitle("CSI Heatmaps")
+
+    plt.show()
+
+
+    # ============================================
+    # MOTION TRACKING FOR ALL DATASETS
+    # ============================================
+
+    paths = [None] * len(raw)
+
+    for idxs, stack in stacks:
+        for i, path in zip(idxs, compute_motion_paths(stack)):
+            paths[i] = path
+
+    motion_paths = list(zip(names, paths))
+
+
+    # ============================================
+    # HEATMAP + MOTION PATH OVERLAY
+    # ============================================
+
+    fig, axes = plt.subplots(2,2, figsize=(14,10))
+
+    for ax, (name, display), (_, path) in zip(axes.flat, normalized_sets, motion_paths):
+
+        im = ax.imshow(
+            downsample_for_display(display),
+            aspect='auto',
+            origin='lower',
+            cmap='RdBu_r',
+            extent=(0, display.shape[1], 0, display.shape[0])
+        )
+
+        ax.plot(path, color='lime', linewidth=2)
+
+        ax.set_title(name)
+        ax.set_xlabel("Time Frame")
+        ax.set_ylabel("Subcarrier Index")
+
+    fig.colorbar(im, ax=axes)
+    plt.suptitle("Motion Tracking Comparison")
+
+    plt.show()
+
+
+    # ============================================
+    # MOTION PATH COMPARISON GRAPH
+    # ============================================
+
+    plt.figure(figsize=(12,6))
+
+    for name, path in motion_paths:
 
-plt.figure(figsize=(12,6))
+        plt.plot(path, label=name)
 
-for name, path in motion_paths:
+    plt.title("Motion Path Comparison Across All Datasets")
 
-    plt.plot(path, label=name)
+    plt.xlabel("Time Frame")
+    plt.ylabel("Detected Motion Position")
 
-plt.title("Motion Path Comparison Across All Datasets")
+    plt.legend()
+    plt.grid()
 
-plt.xlabel("Time Frame")
-plt.ylabel("Detected Motion Position")
+    plt.show()
 
-plt.legend()
-plt.grid()
 
-plt.show()
+if __name__ == "__main__":
+    main()
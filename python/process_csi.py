@@ -1,30 +1,96 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
+import scipy.fft
 from scipy.ndimage import gaussian_filter1d
+from scipy.signal import fftconvolve, sosfiltfilt, tf2sos
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
 
 # ============================================
 # LOAD CSI FILE
 # ============================================
-def load_csi(filename):
-    data = []
-    with open(filename, "r") as f:
+def load_csi(filename, dtype=np.float32):
+    # Reuse the parsed array from the sidecar .npy when it is newer
+    # than the text capture — np.load with mmap skips parsing entirely.
+    # The version suffix retires caches written in the old time-major
+    # (T, K) orientation, which would otherwise load silently transposed
+    cache = filename + ".v2.npy"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(filename):
+        cached = np.load(cache, mmap_mode="r")
+        if cached.dtype == dtype:
+            return cached
+
+    # Two-pass streaming parse over raw bytes: count matching lines
+    # and the widest row first, then np.fromstring every payload
+    # straight into a preallocated array — no Python list-of-rows is
+    # ever built, so peak memory stays flat however long the capture
+    with open(filename, "rb") as f:
+        n_rows = 0
+        max_cols = 0
+        for line in f:
+            if b"CSI_DATA:" in line:
+                n_rows += 1
+                cols = line.count(b" ") + 1
+                if cols > max_cols:
+                    max_cols = cols
+
+        if n_rows == 0:
+            raise ValueError(f"No CSI data found in {filename}")
+
+        arr = np.empty((n_rows, max_cols), dtype=np.int16)
+        lens = np.zeros(n_rows, dtype=np.int32)
+
+        f.seek(0)
+        i = 0
         for line in f:
-            if "CSI_DATA:" in line:
-                parts = line.replace("CSI_DATA:", "").strip().split()
-                try:
-                    values = [int(x) for x in parts]
-                    data.append(values)
-                except:
-                    pass
+            marker = line.find(b"CSI_DATA:")
+            if marker < 0:
+                continue
+            try:
+                row = np.fromstring(line[marker + 9:], sep=" ", dtype=np.int16)
+            except ValueError:
+                row = None
+            if row is not None and row.size:
+                lens[i] = row.size
+                arr[i, :row.size] = row
+            i += 1
+
+    # Drop unparsable rows, trim the rest to equal length (subcarrier
+    # consistency); float32 halves the bytes moved downstream
+    valid = lens > 0
+    min_len = int(lens[valid].min())
+
+    # Subcarrier-major (K, T) layout: heatmaps render this orientation
+    # directly and per-subcarrier reductions walk contiguous rows
+    arr = arr[valid][:, :min_len].astype(dtype).T.copy()
+    np.save(cache, arr)
+
+    return arr
+
+
+# ============================================
+# MEAN |CSI| ENERGY (REUSABLE BUFFER)
+# ============================================
+_energy_buf = None
 
-    if len(data) == 0:
-        raise ValueError(f"No CSI data found in {filename}")
+def mean_abs_energy(data):
+    # np.abs writes into one reusable buffer instead of allocating a
+    # fresh temporary; works on a single (K, T) dataset or the whole
+    # (N, K, T) stack, reducing over the subcarrier axis
+    global _energy_buf
+    if _energy_buf is None or _energy_buf.shape != data.shape:
+        _energy_buf = np.empty(data.shape, dtype=np.float32)
 
-    # Make all rows equal length (subcarrier consistency)
-    min_len = min(len(row) for row in data)
-    data = [row[:min_len] for row in data]
+    np.abs(data, out=_energy_buf)
 
-    return np.array(data)
+    return _energy_buf.mean(axis=-2, dtype=np.float64)
 
 
 # ============================================
@@ -39,182 +105,285 @@ def normalize_for_display(data):
 
 
 # ============================================
-# PREPROCESS FOR MOTION TRACKING
+# RECURSIVE GAUSSIAN SMOOTHER (YOUNG-VAN VLIET)
 # ============================================
-def preprocess_csi(data):
-    # Remove static component (per subcarrier)
-    data = data - np.mean(data, axis=0)
+def _gaussian_sos(sigma):
+    # 3rd-order recursive Gaussian; a forward+backward sosfiltfilt pass
+    # approximates the symmetric filter in O(T) regardless of sigma
+    if sigma >= 2.5:
+        q = 0.98711 * sigma - 0.96330
+    else:
+        q = 3.97156 - 4.14554 * np.sqrt(1.0 - 0.26891 * sigma)
 
-    # Convert to magnitude
-    data = np.abs(data)
+    b0 = 1.57825 + 2.44413 * q + 1.4281 * q ** 2 + 0.422205 * q ** 3
+    b1 = 2.44413 * q + 2.85619 * q ** 2 + 1.26661 * q ** 3
+    b2 = -(1.4281 * q ** 2 + 1.26661 * q ** 3)
+    b3 = 0.422205 * q ** 3
+    gain = 1.0 - (b1 + b2 + b3) / b0
 
-    # Smooth noise over time
-    data = gaussian_filter1d(data, sigma=2, axis=0)
+    return tf2sos([gain], [1.0, -b1 / b0, -b2 / b0, -b3 / b0])
 
-    return data
 
+# float32 coefficients keep sosfiltfilt from upcasting the data
+_GAUSS_SOS = _gaussian_sos(2.0).astype(np.float32)
 
-# ============================================
-# COMPUTE MOTION PATH (CENTROID METHOD)
-# ============================================
-def compute_motion_path(data):
-    processed = preprocess_csi(data)
 
-    path = []
+def _gauss_kernel(sigma, truncate=4.0):
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (x / sigma) ** 2)
+    return (kernel / kernel.sum()).astype(np.float32)
 
-    for t in range(processed.shape[0]):
-        signal = processed[t]
-        total_energy = np.sum(signal)
 
-        if total_energy == 0:
-            centroid = 0
-        else:
-            indices = np.arange(len(signal))
-            centroid = np.sum(indices * signal) / total_energy
+_GAUSS_KERNEL = _gauss_kernel(2.0)
 
-        path.append(centroid)
+# Below this many frames the recursive filter wins; above it, one
+# multi-threaded FFT convolution shared by all subcarriers is faster
+_FFT_MIN_FRAMES = 4096
 
-    path = np.array(path)
 
-    # Smooth final motion curve
-    path = gaussian_filter1d(path, sigma=2)
+def _smooth_time(data, axis=0):
+    if data.shape[axis] >= _FFT_MIN_FRAMES:
+        shape = [1] * data.ndim
+        shape[axis] = _GAUSS_KERNEL.size
+        with scipy.fft.set_workers(-1):
+            return fftconvolve(data, _GAUSS_KERNEL.reshape(shape), mode="same", axes=axis)
 
-    return path
+    return sosfiltfilt(_GAUSS_SOS, data, axis=axis)
 
 
 # ============================================
-# LOAD DATASETS
+# PREPROCESS FOR MOTION TRACKING
 # ============================================
-print("Loading CSI datasets...")
+def preprocess_csi(data):
+    # Static removal and magnitude share one float32 buffer — a single
+    # K x T temporary instead of one per stage
+    means = np.mean(data, axis=1, keepdims=True)
 
-empty = load_csi("../data/empty.txt")
-occupied = load_csi("../data/occupied.txt")
-walking = load_csi("../data/walking.txt")
-multi_occ = load_csi("../data/multi_occ.txt")
+    buf = np.empty(data.shape, dtype=np.float32)
+    np.subtract(data, means, out=buf)
+    np.abs(buf, out=buf)
 
-# ============================================
-# FORCE ALL DATASETS TO SAME TIME LENGTH
-# ============================================
-min_time = min(
-    empty.shape[0],
-    occupied.shape[0],
-    walking.shape[0],
-    multi_occ.shape[0]
-)
+    # Smooth noise over time — all subcarriers in one pass
+    return _smooth_time(buf, axis=1)
 
-empty = empty[:min_time]
-occupied = occupied[:min_time]
-walking = walking[:min_time]
-multi_occ = multi_occ[:min_time]
 
-print("All datasets trimmed to:", min_time, "time frames")
+# ============================================
+# SUBCARRIER INDEX CACHE
+# ============================================
+_idx_cache = {}
 
-datasets = [
-    ("Empty Room", empty),
-    ("Occupied (Still)", occupied),
-    ("Walking", walking),
-    ("Multiple People", multi_occ)
-]
+def _subcarrier_idx(n, dtype):
+    # The centroid weights only depend on (K, dtype) — build them once
+    key = (n, np.dtype(dtype))
+    idx = _idx_cache.get(key)
+    if idx is None:
+        idx = np.arange(n, dtype=dtype)
+        _idx_cache[key] = idx
+    return idx
 
 
 # ============================================
-# ENERGY COMPARISON (COMBINED GRAPH)
+# FUSED MOTION KERNEL (NUMBA)
 # ============================================
-empty_energy = np.mean(np.abs(empty), axis=1)
-occupied_energy = np.mean(np.abs(occupied), axis=1)
-walking_energy = np.mean(np.abs(walking), axis=1)
-multi_occ_energy = np.mean(np.abs(multi_occ), axis=1)
-
-plt.figure(figsize=(12,6))
-plt.plot(empty_energy, label="Empty Room")
-plt.plot(occupied_energy, label="Occupied (Still)")
-plt.plot(walking_energy, label="Walking")
-plt.plot(multi_occ_energy, label="Multiple People")
-plt.title("CSI Energy Comparison")
-plt.xlabel("Time Frame")
-plt.ylabel("CSI Energy")
-plt.legend()
-plt.grid()
-plt.show()
+if NUMBA_AVAILABLE:
+
+    @njit(parallel=True, fastmath=True)
+    def _motion_kernel(data, means, out_total, out_weighted):
+        # Static removal, magnitude and the centroid reductions
+        # fused into one pass over a (K, T) array.
+        for t in prange(data.shape[1]):
+            total = 0.0
+            weighted = 0.0
+            for k in range(data.shape[0]):
+                v = abs(data[k, t] - means[k])
+                total += v
+                weighted += k * v
+            out_total[t] = total
+            out_weighted[t] = weighted
 
 
 # ============================================
-# ENERGY GRAPHS — SEPARATE
+# COMPUTE MOTION PATHS (CENTROID METHOD)
 # ============================================
-energy_sets = [
-    ("Empty Room", empty_energy),
-    ("Occupied (Still)", occupied_energy),
-    ("Walking", walking_energy),
-    ("Multiple People", multi_occ_energy)
-]
+def compute_motion_paths(stack):
+    # Batched over an (N, K, T) stack — one reduction per stage
+    # instead of one dispatch per dataset
+    n_frames = stack.shape[2]
 
-fig, axes = plt.subplots(2, 2, figsize=(14,10))
+    if NUMBA_AVAILABLE:
+        means = stack.mean(axis=2)
+        total = np.zeros((stack.shape[0], n_frames), dtype=np.float32)
+        weighted = np.zeros((stack.shape[0], n_frames), dtype=np.float32)
 
-for ax, (name, energy) in zip(axes.flat, energy_sets):
-    ax.plot(energy)
-    ax.set_title(f"{name} — CSI Energy")
-    ax.set_xlabel("Time Frame")
-    ax.set_ylabel("CSI Energy")
-    ax.grid(True)
+        for i in range(stack.shape[0]):
+            _motion_kernel(stack[i], means[i], total[i], weighted[i])
 
-plt.suptitle("CSI Energy — Individual Dataset Analysis", fontsize=14)
-plt.tight_layout()
-plt.show()
+        # Time smoothing commutes with the linear subcarrier
+        # reductions, so smoothing the two accumulators matches the
+        # fallback's full 2D smoothing at 1/K of the cost
+        total = _smooth_time(total, axis=1)
+        weighted = _smooth_time(weighted, axis=1)
 
+        paths = weighted / np.maximum(total, 1e-12)
+    else:
+        processed = np.abs(stack - stack.mean(axis=2, keepdims=True))
+        processed = _smooth_time(processed, axis=2)
 
-# ============================================
-# MOTION TRACKING
-# ============================================
-motion_paths = []
+        # Weighted subcarrier centroid per frame (vectorized over time)
+        idx = _subcarrier_idx(stack.shape[1], processed.dtype)
+        weighted = idx @ processed
+        total = processed.sum(axis=1)
 
-for name, data in datasets:
-    path = compute_motion_path(data)
-    motion_paths.append((name, path))
+        # Branchless masked division: zero frames stay zero without
+        # evaluating the division for them
+        paths = np.zeros_like(total)
+        np.divide(weighted, total, out=paths, where=total > 0)
 
+    # Smooth final motion curves — truncate=3.0 trims the kernel
+    # radius by 25% and the float32 output avoids a float64 upcast
+    paths = gaussian_filter1d(paths, sigma=2, axis=-1, truncate=3.0, output=np.float32)
 
+    return paths
 
-# ============================================
-# MOTION PATH COMPARISON GRAPH
-# ============================================
-plt.figure(figsize=(12,6))
 
-for name, path in motion_paths:
-    plt.plot(path, label=name)
+def compute_motion_path(data):
+    return compute_motion_paths(data[np.newaxis])[0]
 
-plt.title("Motion Path Comparison Across Datasets")
-plt.xlabel("Time Frame")
-plt.ylabel("Detected Motion Position (Subcarrier Index)")
-plt.legend()
-plt.grid()
-plt.show()
 
 # ============================================
-# SCATTER PLOTS — SEPARATE GRAPHS
+# MAIN
 # ============================================
+def main():
+
+    # ============================================
+    # LOAD DATASETS
+    # ============================================
+    print("Loading CSI datasets...")
+
+    # Each capture parses independently — overlap the file I/O and parsing
+    # across one worker per dataset
+    with ProcessPoolExecutor(max_workers=4) as ex:
+        empty, occupied, walking, multi_occ = ex.map(load_csi, [
+            "../data/empty.txt",
+            "../data/occupied.txt",
+            "../data/walking.txt",
+            "../data/multi_occ.txt",
+        ])
+
+    # ============================================
+    # BATCH DATASETS INTO PER-WIDTH (N, K, T) STACKS
+    # ============================================
+    names = ["Empty Room", "Occupied (Still)", "Walking", "Multiple People"]
+    raw = [empty, occupied, walking, multi_occ]
+
+    # Only time is common across captures — each keeps its own
+    # subcarrier width, so datasets are grouped by K and every group
+    # batches into one stack
+    min_time = min(d.shape[1] for d in raw)
+    trimmed = [d[:, :min_time] for d in raw]
+
+    groups = {}
+    for i, d in enumerate(trimmed):
+        groups.setdefault(d.shape[0], []).append(i)
+
+    stacks = [(idxs, np.stack([trimmed[i] for i in idxs]).astype(np.float32))
+              for idxs in groups.values()]
+
+    print("All datasets trimmed to:", min_time, "time frames")
+
+    datasets = list(zip(names, trimmed))
+
+
+    # ============================================
+    # ENERGY COMPARISON (COMBINED GRAPH)
+    # ============================================
+    energies = [None] * len(raw)   # one (T,) curve per dataset
+    for idxs, stack in stacks:
+        for i, energy in zip(idxs, mean_abs_energy(stack)):
+            energies[i] = energy
+
+    plt.figure(figsize=(12,6))
+    for name, energy in zip(names, energies):
+        plt.plot(energy, label=name)
+    plt.title("CSI Energy Comparison")
+    plt.xlabel("Time Frame")
+    plt.ylabel("CSI Energy")
+    plt.legend()
+    plt.grid()
+    plt.show()
+
+
+    # ============================================
+    # ENERGY GRAPHS — SEPARATE
+    # ============================================
+    energy_sets = list(zip(names, energies))
+
+    fig, axes = plt.subplots(2, 2, figsize=(14,10))
+
+    for ax, (name, energy) in zip(axes.flat, energy_sets):
+        ax.plot(energy)
+        ax.set_title(f"{name} — CSI Energy")
+        ax.set_xlabel("Time Frame")
+        ax.set_ylabel("CSI Energy")
+        ax.grid(True)
+
+    plt.suptitle("CSI Energy — Individual Dataset Analysis", fontsize=14)
+    plt.tight_layout()
+    plt.show()
+
+
+    # ============================================
+    # MOTION TRACKING
+    # ============================================
+    paths = [None] * len(raw)
+    for idxs, stack in stacks:
+        for i, path in zip(idxs, compute_motion_paths(stack)):
+            paths[i] = path
+
+    motion_paths = list(zip(names, paths))
+
+
+    # ============================================
+    # MOTION PATH COMPARISON GRAPH
+    # ============================================
+    plt.figure(figsize=(12,6))
+
+    for name, path in motion_paths:
+        plt.plot(path, label=name)
+
+    plt.title("Motion Path Comparison Across Datasets")
+    plt.xlabel("Time Frame")
+    plt.ylabel("Detected Motion Position (Subcarrier Index)")
+    plt.legend()
+    plt.grid()
+    plt.show()
+
+    # ============================================
+    # SCATTER PLOTS — SEPARATE GRAPHS
+    # ============================================
+
+    scatter_sets = list(zip(names, energies, ["blue", "green", "orange", "red"]))
+
+    fig, axes = plt.subplots(2, 2, figsize=(14,10))
+
+    for ax, (name, energy, color) in zip(axes.flat, scatter_sets):
+        ax.scatter(
+            np.arange(len(energy)),
+            energy,
+            s=12,
+            alpha=0.6,
+            color=color
+        )
+        ax.set_title(f"{name} — CSI Energy Scatter")
+        ax.set_xlabel("Time Frame")
+        ax.set_ylabel("CSI Energy")
+        ax.grid(True)
+
+    plt.suptitle("CSI Energy Scatter Comparison (All Scenarios)", fontsize=14)
+    plt.tight_layout()
+    plt.show()
+
 
-scatter_sets = [
-    ("Empty Room", empty_energy, "blue"),
-    ("Occupied (Still)", occupied_energy, "green"),
-    ("Walking", walking_energy, "orange"),
-    ("Multiple People", multi_occ_energy, "red")
-]
-
-fig, axes = plt.subplots(2, 2, figsize=(14,10))
-
-for ax, (name, energy, color) in zip(axes.flat, scatter_sets):
-    ax.scatter(
-        np.arange(len(energy)),
-        energy,
-        s=12,
-        alpha=0.6,
-        color=color
-    )
-    ax.set_title(f"{name} — CSI Energy Scatter")
-    ax.set_xlabel("Time Frame")
-    ax.set_ylabel("CSI Energy")
-    ax.grid(True)
-
-plt.suptitle("CSI Energy Scatter Comparison (All Scenarios)", fontsize=14)
-plt.tight_layout()
-plt.show()
-
+if __name__ == "__main__":
+    main()